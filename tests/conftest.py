@@ -0,0 +1,6 @@
+import os
+import sys
+
+
+# `whisper_q` is not an installable package: make it importable when running `pytest` from a checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
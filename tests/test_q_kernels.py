@@ -0,0 +1,81 @@
+import pytest
+
+
+torch = pytest.importorskip("torch")
+# imported by `whisper_q/__init__.py`
+pytest.importorskip("bitsandbytes")
+pytest.importorskip("triton")
+
+from whisper_q.q_layers import (  # noqa: E402
+    _TRITON_AVAILABLE,
+    _int8_matmul,
+    _pack_ternary,
+    _sym_quantize_int8,
+    _twn_codes,
+    sym_quantize,
+    twn_quantize,
+)
+
+
+requires_int8_tensor_cores = pytest.mark.skipif(
+    not (_TRITON_AVAILABLE and torch.cuda.is_available() and torch.cuda.get_device_capability()[0] >= 8),
+    reason="the fused Triton kernels need a CUDA device with compute capability 8.0+",
+)
+
+CLIP_VAL = 2.5
+# (M, K, N): decoding batches with M <= 16 and K not a multiple of the 64-wide K tile
+SHAPES = [(1, 96, 64), (16, 80, 48), (33, 128, 72)]
+
+
+def _ternary_weight(n, k):
+    weight = torch.randn(n, k, device="cuda")
+    weight_int8, weight_scale = _twn_codes(weight.clamp(-CLIP_VAL, CLIP_VAL), layerwise=True)
+    return weight, weight_int8.to(torch.int8), weight_scale.float().expand(n).contiguous()
+
+
+def _int8_matmul_linear(input, weight_int8, weight_scale, bias):
+    # the unfused path of `QuantizeLinear._int8_forward`
+    input_int8, input_scale = _sym_quantize_int8(input, -CLIP_VAL, CLIP_VAL, 8)
+    out = _int8_matmul(input_int8, weight_int8.t())
+    return out.float() * (weight_scale / input_scale) + bias
+
+
+def _float_linear(input, weight, bias):
+    input = sym_quantize(input, -CLIP_VAL, CLIP_VAL, 8, True)
+    weight = twn_quantize(weight, -CLIP_VAL, CLIP_VAL, 2, True)
+    return torch.nn.functional.linear(input, weight, bias)
+
+
+@requires_int8_tensor_cores
+@pytest.mark.parametrize("m, k, n", SHAPES)
+@torch.no_grad()
+def test_symquant_int8_linear(m, k, n):
+    from whisper_q.q_kernels import symquant_int8_linear
+
+    torch.manual_seed(0)
+    input = torch.randn(m, k, device="cuda")
+    bias = torch.randn(n, device="cuda")
+    weight, weight_int8, weight_scale = _ternary_weight(n, k)
+
+    out = symquant_int8_linear(input, weight_int8, weight_scale, bias, -CLIP_VAL, CLIP_VAL, 8)
+
+    torch.testing.assert_close(out, _int8_matmul_linear(input, weight_int8, weight_scale, bias))
+    torch.testing.assert_close(out, _float_linear(input, weight, bias), rtol=1e-4, atol=1e-3)
+
+
+@requires_int8_tensor_cores
+@pytest.mark.parametrize("m, k, n", SHAPES)
+@torch.no_grad()
+def test_symquant_ternary_linear(m, k, n):
+    from whisper_q.q_kernels import symquant_ternary_linear
+
+    torch.manual_seed(0)
+    input = torch.randn(m, k, device="cuda")
+    bias = torch.randn(n, device="cuda")
+    weight, weight_int8, weight_scale = _ternary_weight(n, k)
+    weight_signs, weight_nonzero = _pack_ternary(weight_int8)
+
+    out = symquant_ternary_linear(input, weight_signs, weight_nonzero, weight_scale, bias, -CLIP_VAL, CLIP_VAL, 8)
+
+    torch.testing.assert_close(out, _int8_matmul_linear(input, weight_int8, weight_scale, bias))
+    torch.testing.assert_close(out, _float_linear(input, weight, bias), rtol=1e-4, atol=1e-3)
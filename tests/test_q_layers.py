@@ -0,0 +1,170 @@
+import pytest
+
+
+torch = pytest.importorskip("torch")
+# imported by `whisper_q/__init__.py`
+pytest.importorskip("bitsandbytes")
+
+from whisper_q import q_layers  # noqa: E402
+from whisper_q.q_layers import (  # noqa: E402
+    QuantizeLinear,
+    _pack_ternary,
+    _unpack_ternary,
+    pack_model_for_inference,
+    set_quant_phase,
+    sym_quantize,
+    twn_quantize,
+)
+
+
+@pytest.mark.parametrize("k", [32, 80, 96])
+def test_pack_unpack_ternary(k):
+    torch.manual_seed(0)
+    codes = torch.randint(-1, 2, (8, k), dtype=torch.int8)
+    # all-negative rows set the top (sign) bit of every word
+    codes[0] = -1
+
+    signs, nonzero = _pack_ternary(codes)
+
+    assert signs.dtype == nonzero.dtype == torch.int32
+    assert signs.shape == nonzero.shape == (8, -(-k // 32))
+    assert torch.equal(_unpack_ternary(signs, nonzero, k), codes)
+
+
+def test_set_quant_phase():
+    model = torch.nn.Sequential(QuantizeLinear(8, 8, quantize_act=False, weight_bits=2))
+    layer = model[0]
+
+    set_quant_phase(model, "warmup")
+    assert layer._act_noop and layer.weight_bits == 16
+
+    set_quant_phase(model, "int2")
+    assert layer.quantize_act and not layer._act_noop
+    assert layer.input_bits == 8 and layer.weight_bits == 2 and layer.weight_quantizer is twn_quantize
+
+
+def test_quantizers_eager(monkeypatch):
+    from torch._dynamo.utils import counters
+
+    input = torch.randn(4, 16, dtype=torch.float64)
+    expected = q_layers._sym_quantize.__wrapped__(input, -2.5, 2.5, 8, None)
+
+    monkeypatch.setattr(q_layers, "COMPILE_QUANTIZERS", False)
+    frames = counters["frames"]["total"]
+    torch.testing.assert_close(sym_quantize(input, -2.5, 2.5, 8, True), expected)
+    assert counters["frames"]["total"] == frames
+
+
+@torch.no_grad()
+def test_weight_cache():
+    torch.manual_seed(0)
+    layer = QuantizeLinear(16, 16).eval()
+
+    def check_recomputed(previous):
+        weight = layer._quantize_weight(layerwise=True)
+        assert weight is not previous
+        torch.testing.assert_close(weight, layer.weight_quantizer(layer.weight, -2.5, 2.5, layer.weight_bits, True))
+        return weight
+
+    weight = check_recomputed(None)
+    assert layer._quantize_weight(layerwise=True) is weight
+
+    layer.load_state_dict({"weight": torch.randn(16, 16), "bias": layer.bias})
+    weight = check_recomputed(weight)
+
+    layer.weight = torch.nn.Parameter(torch.randn(16, 16))
+    weight = check_recomputed(weight)
+
+    layer.weight.mul_(2)
+    weight = check_recomputed(weight)
+
+    layer._set_weight_bits(8)
+    weight = check_recomputed(weight)
+    assert layer._quantize_weight(layerwise=True) is weight
+
+
+@torch.no_grad()
+def test_weight_cache_compiled():
+    layer = QuantizeLinear(16, 16).eval()
+    input = torch.randn(4, 16)
+    compiled = torch.compile(layer, backend="eager", fullgraph=True)
+
+    for _ in range(2):
+        torch.testing.assert_close(compiled(input), layer(input))
+
+
+@pytest.mark.skipif(not q_layers._TRITON_AVAILABLE, reason="bit-packing requires triton")
+@torch.no_grad()
+def test_pack_ternary_unfused():
+    torch.manual_seed(0)
+    layer = QuantizeLinear(64, 32).eval()
+    input = torch.randn(3, 5, 64)
+    expected = layer(input)
+
+    layer.pack_ternary_()
+    assert layer.weight_int8 is None and "weight_signs" not in layer.state_dict()
+
+    # without the fused kernel the bit-packed weight is unpacked once, on the first forward
+    torch.testing.assert_close(layer(input), expected, rtol=1e-4, atol=1e-4)
+    weight_int8 = layer.weight_int8
+    assert weight_int8 is not None and layer.weight_signs is not None
+    torch.testing.assert_close(layer(input), expected, rtol=1e-4, atol=1e-4)
+    assert layer.weight_int8 is weight_int8
+
+
+@pytest.mark.parametrize("weight_bits", [2, 8])
+@torch.no_grad()
+def test_int8_forward(weight_bits):
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(QuantizeLinear(64, 32, weight_bits=weight_bits)).eval()
+    input = torch.randn(3, 5, 64)
+    expected = model(input)
+
+    pack_model_for_inference(model)
+
+    assert model[0].weight_int8 is not None
+    torch.testing.assert_close(model(input), expected, rtol=1e-4, atol=1e-4)
+
+
+@torch.no_grad()
+def test_int8_forward_after_cast():
+    torch.manual_seed(0)
+    layer = QuantizeLinear(64, 32).eval()
+    layer.pack_for_inference()
+    weight_int8 = layer.weight_int8
+
+    layer.to("cpu").double()
+    input = torch.randn(3, 64, dtype=torch.float64)
+    out = layer(input)
+
+    assert torch.equal(layer.weight_int8, weight_int8)
+    layer._clear_packed_weight()
+    torch.testing.assert_close(out, layer(input))
+
+
+@torch.no_grad()
+def test_int8_forward_stale():
+    torch.manual_seed(0)
+    layer = QuantizeLinear(64, 32).eval()
+    input = torch.randn(3, 64)
+    layer.pack_for_inference()
+    out = layer(input)
+
+    layer.weight.mul_(-1)
+
+    # the ternary weight flips its sign, while the packed weight would not
+    torch.testing.assert_close(layer(input), 2 * layer.bias - out, rtol=1e-4, atol=1e-4)
+    assert layer.weight_int8 is None and layer.weight_scale is None
+
+
+@pytest.mark.parametrize("quantizer, num_bits", [(sym_quantize, 8), (twn_quantize, 2)])
+def test_quantizer_gradient(quantizer, num_bits):
+    input = torch.tensor([[-3.0, -2.5, -1.0, 0.3, 2.0, 2.5, 3.0]] * 4, requires_grad=True)
+
+    output = quantizer(input, -2.5, 2.5, num_bits, True)
+    output.backward(torch.ones_like(output))
+
+    # identity inside the clipping range, zero at and outside of its bounds
+    torch.testing.assert_close(input.grad, ((input > -2.5) & (input < 2.5)).float())
+    with torch.no_grad():
+        torch.testing.assert_close(output, quantizer(input, -2.5, 2.5, num_bits, True))
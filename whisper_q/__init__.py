@@ -1,5 +1,5 @@
 from .modeling_whisper_q import WhisperQForConditionalGeneration
 from .configuration_whisper_q import WhisperQConfig
-from .q_layers import QuantizeLinear, QuantizeEmbedding, QuantizeConv
+from .q_layers import QuantizeLinear, QuantizeEmbedding, QuantizeConv, pack_model_for_inference, set_quant_phase
 
 from .modeling_whisper_bnb import WhisperBnbForConditionalGeneration
\ No newline at end of file
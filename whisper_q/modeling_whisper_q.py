@@ -40,7 +40,7 @@ from transformers.utils import (
 )
 
 from .configuration_whisper_q import WhisperQConfig
-from .q_layers import QuantizeConv, QuantizeEmbedding, QuantizeLinear, SymQuantizer
+from .q_layers import QuantizeConv, QuantizeEmbedding, QuantizeLinear, _ActQuantizationMixin
 
 
 logger = logging.get_logger(__name__)
@@ -111,7 +111,7 @@ class WhisperPositionalEmbedding(nn.Embedding):
         return self.weight[past_key_values_length : past_key_values_length + input_ids.shape[-1]]
 
 
-class WhisperQAttention(nn.Module):
+class WhisperQAttention(_ActQuantizationMixin, nn.Module):
     """Multi-headed attention from 'Attention Is All You Need' paper with quantization."""
 
     def __init__(
@@ -177,14 +177,8 @@ class WhisperQAttention(nn.Module):
             clip_val=clip_val,
         )
 
-        self.quantize_act = quantize_act
-        if self.quantize_act:
-            self.input_bits = input_bits
-            self.act_quantizer = SymQuantizer
-            self.register_buffer("clip_query", torch.Tensor([-clip_val, clip_val]))
-            self.register_buffer("clip_key", torch.Tensor([-clip_val, clip_val]))
-            self.register_buffer("clip_value", torch.Tensor([-clip_val, clip_val]))
-            self.register_buffer("clip_attn", torch.Tensor([-clip_val, clip_val]))
+        self.clip_val = clip_val
+        self._init_act_quant(quantize_act, input_bits)
 
     def _shape(self, tensor: torch.Tensor, seq_len: int, bsz: int):
         return tensor.view(bsz, seq_len, self.num_heads, self.head_dim).transpose(1, 2).contiguous()
@@ -252,9 +246,9 @@ class WhisperQAttention(nn.Module):
 
         src_len = key_states.size(1)
 
-        if self.quantize_act:
-            query_states = self.act_quantizer.apply(query_states, self.clip_query, self.input_bits, True)
-            key_states = self.act_quantizer.apply(key_states, self.clip_key, self.input_bits, True)
+        if not self._act_noop:
+            query_states = self.act_quantizer(query_states, -self.clip_val, self.clip_val, self.input_bits, True)
+            key_states = self.act_quantizer(key_states, -self.clip_val, self.clip_val, self.input_bits, True)
 
         attn_weights = torch.bmm(query_states, key_states.transpose(1, 2))
 
@@ -296,9 +290,9 @@ class WhisperQAttention(nn.Module):
         attn_probs = nn.functional.dropout(attn_weights, p=self.dropout, training=self.training)
 
         # quantize both attention probs and value states for dot product
-        if self.quantize_act:
-            attn_probs = self.act_quantizer.apply(attn_probs, self.clip_attn, self.input_bits, True)
-            value_states = self.act_quantizer.apply(value_states, self.clip_value, self.input_bits, True)
+        if not self._act_noop:
+            attn_probs = self.act_quantizer(attn_probs, -self.clip_val, self.clip_val, self.input_bits, True)
+            value_states = self.act_quantizer(value_states, -self.clip_val, self.clip_val, self.input_bits, True)
 
         attn_output = torch.bmm(attn_probs, value_states)
 
@@ -554,6 +548,8 @@ class WhisperQPreTrainedModel(PreTrainedModel):
     main_input_name = "input_features"
     supports_gradient_checkpointing = True
     _no_split_modules = ["WhisperQEncoderLayer"]
+    # clipping ranges used to be stored as buffers
+    _keys_to_ignore_on_load_unexpected = [r"clip_val", r"clip_query", r"clip_key", r"clip_value", r"clip_attn"]
 
     def _init_weights(self, module):
         std = self.config.init_std
@@ -0,0 +1,251 @@
+# coding=utf-8
+# Copyright 2021 Huawei Technologies Co., Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+""" Triton kernels for quantized inference. Requires `triton` and PyTorch >= 2.4 (`torch.library.custom_op`)."""
+from typing import Optional
+
+import torch
+import triton
+import triton.language as tl
+
+
+try:
+    from triton.language.extra import libdevice
+except ImportError:  # triton < 3.0
+    libdevice = tl.math
+
+
+@triton.jit
+def _symquant_int8_matmul_kernel(
+    x_ptr,
+    w_ptr,
+    w_nonzero_ptr,
+    w_scale_ptr,
+    x_scale_ptr,
+    bias_ptr,
+    out_ptr,
+    M,
+    N,
+    K,
+    stride_xm,
+    stride_xk,
+    stride_wn,
+    stride_wk,
+    stride_om,
+    stride_on,
+    lo,
+    hi,
+    HAS_BIAS: tl.constexpr,
+    TERNARY: tl.constexpr,
+    BLOCK_M: tl.constexpr,
+    BLOCK_N: tl.constexpr,
+    BLOCK_K: tl.constexpr,
+):
+    pid_m = tl.program_id(0)
+    pid_n = tl.program_id(1)
+    offs_m = pid_m * BLOCK_M + tl.arange(0, BLOCK_M)
+    offs_n = pid_n * BLOCK_N + tl.arange(0, BLOCK_N)
+    offs_k = tl.arange(0, BLOCK_K)
+
+    x_scale = tl.load(x_scale_ptr)
+    acc = tl.zeros((BLOCK_M, BLOCK_N), dtype=tl.int32)
+    for k in range(0, K, BLOCK_K):
+        k_idx = k + offs_k
+        x = tl.load(
+            x_ptr + offs_m[:, None] * stride_xm + k_idx[None, :] * stride_xk,
+            mask=(offs_m[:, None] < M) & (k_idx[None, :] < K),
+            other=0.0,
+        ).to(tl.float32)
+        # quantize the activation tile in registers, it is never written back to global memory
+        x = tl.minimum(tl.maximum(x, lo), hi)
+        x_int8 = libdevice.rint(x * x_scale).to(tl.int8)
+
+        w_mask = (k_idx[:, None] < K) & (offs_n[None, :] < N)
+        if TERNARY:
+            # 32 ternary weights per int32 word: expand the sign and non-zero bits of the tile to {-1, 0, 1}
+            bit = k_idx[:, None] % 32
+            w_offs = (k_idx[:, None] // 32) * stride_wk + offs_n[None, :] * stride_wn
+            sign = (tl.load(w_ptr + w_offs, mask=w_mask, other=0) >> bit) & 1
+            nonzero = (tl.load(w_nonzero_ptr + w_offs, mask=w_mask, other=0) >> bit) & 1
+            w = (nonzero * (1 - 2 * sign)).to(tl.int8)
+        else:
+            w = tl.load(w_ptr + k_idx[:, None] * stride_wk + offs_n[None, :] * stride_wn, mask=w_mask, other=0)
+        acc += tl.dot(x_int8, w)
+
+    w_scale = tl.load(w_scale_ptr + offs_n, mask=offs_n < N, other=0.0)
+    out = acc.to(tl.float32) * (w_scale[None, :] / x_scale)
+    if HAS_BIAS:
+        out += tl.load(bias_ptr + offs_n, mask=offs_n < N, other=0.0).to(tl.float32)[None, :]
+    tl.store(
+        out_ptr + offs_m[:, None] * stride_om + offs_n[None, :] * stride_on,
+        out.to(out_ptr.dtype.element_ty),
+        mask=(offs_m[:, None] < M) & (offs_n[None, :] < N),
+    )
+
+
+def _symquant_linear(
+    input: torch.Tensor,
+    weight: torch.Tensor,
+    weight_nonzero: Optional[torch.Tensor],
+    weight_scale: torch.Tensor,
+    bias: Optional[torch.Tensor],
+    lo: float,
+    hi: float,
+    num_bits: int,
+) -> torch.Tensor:
+    x = input.reshape(-1, input.shape[-1])
+    M, K = x.shape
+    N = weight.shape[0]
+
+    # the per-tensor scale needs a global reduction, which is the only extra read of the activations
+    min_input, max_input = torch.aminmax(x)
+    max_input = torch.maximum(max_input, -min_input).float().clamp(max=max(-lo, hi))
+    x_scale = ((2 ** (num_bits - 1) - 1) / max_input).reshape(1)
+
+    out = torch.empty((M, N), dtype=input.dtype, device=input.device)
+    BLOCK_M = 16 if M <= 16 else 64
+    BLOCK_N, BLOCK_K = 64, 64
+    grid = (triton.cdiv(M, BLOCK_M), triton.cdiv(N, BLOCK_N))
+    _symquant_int8_matmul_kernel[grid](
+        x,
+        weight,
+        weight_nonzero if weight_nonzero is not None else weight,
+        weight_scale,
+        x_scale,
+        bias if bias is not None else weight_scale,
+        out,
+        M,
+        N,
+        K,
+        x.stride(0),
+        x.stride(1),
+        weight.stride(0),
+        weight.stride(1),
+        out.stride(0),
+        out.stride(1),
+        lo,
+        hi,
+        HAS_BIAS=bias is not None,
+        TERNARY=weight_nonzero is not None,
+        BLOCK_M=BLOCK_M,
+        BLOCK_N=BLOCK_N,
+        BLOCK_K=BLOCK_K,
+    )
+    return out.view(*input.shape[:-1], N)
+
+
+def _symquant_linear_backward(
+    grad_output: torch.Tensor, input: torch.Tensor, weight: torch.Tensor, lo: float, hi: float
+) -> torch.Tensor:
+    # straight-through estimator wrt the activations (same rule as `q_layers._clipped_ste`), the weights are frozen
+    grad_input = grad_output @ weight.to(grad_output.dtype)
+    return torch.where((input > lo) & (input < hi), grad_input, 0)
+
+
+@torch.library.custom_op("whisper_q::symquant_int8_linear", mutates_args=())
+def symquant_int8_linear(
+    input: torch.Tensor,
+    weight_int8: torch.Tensor,
+    weight_scale: torch.Tensor,
+    bias: Optional[torch.Tensor],
+    lo: float,
+    hi: float,
+    num_bits: int,
+) -> torch.Tensor:
+    """
+    Layerwise symmetric activation quantization fused with an int8 linear layer: `input` is clipped to [lo, hi] and
+    rounded to `num_bits` inside the matmul kernel, so the quantized activations never round-trip through HBM.
+
+    Args:
+        input (`torch.Tensor` of shape `(..., in_features)`):
+            Full-precision activations.
+        weight_int8 (`torch.Tensor` of shape `(out_features, in_features)`):
+            Integer weight codes.
+        weight_scale (`torch.Tensor` of shape `(out_features,)`):
+            Per-output-channel dequantization scale of `weight_int8`.
+    """
+    return _symquant_linear(input, weight_int8, None, weight_scale, bias, lo, hi, num_bits)
+
+
+@symquant_int8_linear.register_fake
+def _(input, weight_int8, weight_scale, bias, lo, hi, num_bits):
+    return input.new_empty(*input.shape[:-1], weight_int8.shape[0])
+
+
+def _symquant_int8_linear_setup_context(ctx, inputs, output):
+    input, weight_int8, weight_scale, _, lo, hi, _ = inputs
+    ctx.save_for_backward(input, weight_int8, weight_scale)
+    ctx.lo, ctx.hi = lo, hi
+
+
+def _symquant_int8_linear_backward(ctx, grad_output):
+    input, weight_int8, weight_scale = ctx.saved_tensors
+    weight = weight_int8 * weight_scale.view(-1, 1)
+    grad_input = _symquant_linear_backward(grad_output, input, weight, ctx.lo, ctx.hi)
+    return grad_input, None, None, None, None, None, None
+
+
+symquant_int8_linear.register_autograd(
+    _symquant_int8_linear_backward, setup_context=_symquant_int8_linear_setup_context
+)
+
+
+@torch.library.custom_op("whisper_q::symquant_ternary_linear", mutates_args=())
+def symquant_ternary_linear(
+    input: torch.Tensor,
+    weight_signs: torch.Tensor,
+    weight_nonzero: torch.Tensor,
+    weight_scale: torch.Tensor,
+    bias: Optional[torch.Tensor],
+    lo: float,
+    hi: float,
+    num_bits: int,
+) -> torch.Tensor:
+    """
+    Same as [`symquant_int8_linear`], but with 2-bit packed ternary weights that are expanded to {-1, 0, 1} inside
+    the matmul kernel, so only 2 bits per weight are streamed from HBM.
+
+    Args:
+        weight_signs (`torch.Tensor` of shape `(out_features, ceil(in_features / 32))`):
+            Sign bits of the ternary weight, 32 weights per int32 word.
+        weight_nonzero (`torch.Tensor` of shape `(out_features, ceil(in_features / 32))`):
+            Non-zero bits of the ternary weight, 32 weights per int32 word.
+    """
+    return _symquant_linear(input, weight_signs, weight_nonzero, weight_scale, bias, lo, hi, num_bits)
+
+
+@symquant_ternary_linear.register_fake
+def _(input, weight_signs, weight_nonzero, weight_scale, bias, lo, hi, num_bits):
+    return input.new_empty(*input.shape[:-1], weight_signs.shape[0])
+
+
+def _symquant_ternary_linear_setup_context(ctx, inputs, output):
+    input, weight_signs, weight_nonzero, weight_scale, _, lo, hi, _ = inputs
+    ctx.save_for_backward(input, weight_signs, weight_nonzero, weight_scale)
+    ctx.lo, ctx.hi = lo, hi
+
+
+def _symquant_ternary_linear_backward(ctx, grad_output):
+    # imported here since `q_layers` imports this module
+    from .q_layers import _unpack_ternary
+
+    input, weight_signs, weight_nonzero, weight_scale = ctx.saved_tensors
+    weight = _unpack_ternary(weight_signs, weight_nonzero, input.shape[-1]) * weight_scale.view(-1, 1)
+    grad_input = _symquant_linear_backward(grad_output, input, weight, ctx.lo, ctx.hi)
+    return grad_input, None, None, None, None, None, None, None
+
+
+symquant_ternary_linear.register_autograd(
+    _symquant_ternary_linear_backward, setup_context=_symquant_ternary_linear_setup_context
+)
@@ -12,104 +12,291 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from typing import Any, Tuple, Union
+import functools
+import importlib.util
+import os
+from typing import Optional, Tuple, Union
 
 import torch
 import torch.nn as nn
+from packaging import version
+from transformers.utils import logging
 
 
-class SymQuantizer(torch.autograd.Function):
-    """Symmetric linear quantisation"""
+# `torch._int_mm` only has a (oneDNN) CPU kernel from PyTorch 2.3 onwards
+_CPU_INT_MM_AVAILABLE = version.parse(version.parse(torch.__version__).base_version) >= version.parse("2.3")
 
-    @staticmethod
-    def forward(ctx: Any, input: torch.Tensor, clip_val: torch.Tensor, num_bits: int, layerwise: bool) -> torch.Tensor:
-        ctx.save_for_backward(input, clip_val)
-        input = torch.clamp(input, clip_val[0], clip_val[1])
+# the fused Triton kernels are registered with `torch.library.custom_op`, added in PyTorch 2.4
+_TRITON_AVAILABLE = importlib.util.find_spec("triton") is not None and hasattr(torch.library, "custom_op")
+if _TRITON_AVAILABLE:
+    from .q_kernels import symquant_int8_linear, symquant_ternary_linear
 
-        # NOTE: dynamic scaling (max_input).
-        if layerwise:
-            max_input = torch.max(torch.abs(input)).expand_as(input)
-        else:
-            if input.ndimension() <= 3:
-                # weight & hidden layer
-                max_input = torch.max(torch.abs(input), dim=-1, keepdim=True)[0].expand_as(input).detach()
-            elif input.ndimension() == 4:
-                # TODO: attention score matrix, calculate alpha / beta per head
-                tmp = input.view(input.shape[0], input.shape[1], -1)
-                max_input = torch.max(torch.abs(tmp), dim=-1, keepdim=True)[0].unsqueeze(-1).expand_as(input).detach()
-            else:
-                raise ValueError(
-                    f"Unsupported tensor size for quantization. Expected <4 dimensions, got {input.ndimension()}."
-                )
+logger = logging.get_logger(__name__)
 
-        s = (2 ** (num_bits - 1) - 1) / max_input
-        output = torch.round(input * s).div(s)
+# `torch.compiler.is_compiling` was only added in PyTorch 2.3
+if hasattr(torch, "compiler") and hasattr(torch.compiler, "is_compiling"):
+    _is_compiling = torch.compiler.is_compiling
+else:
+    import torch._dynamo
 
-        return output
+    _is_compiling = torch._dynamo.is_compiling
 
-    @staticmethod
-    def backward(ctx, grad_output):
-        """
-        Args:
-            ctx: saved non-clipped full-precision tensor and clip_val
-            grad_output: gradient wrt the quantized tensor
-        Returns:
-            grad_input: estimated gradient wrt the full-precision tensor
-        """
-        input, clip_val = ctx.saved_tensors  # un-clipped input
-        grad_input = grad_output.clone()
-        grad_input[input.ge(clip_val[1])] = 0
-        grad_input[input.le(clip_val[0])] = 0
-        return grad_input, None, None, None
+# set `WHISPER_Q_COMPILE=0` (or `q_layers.COMPILE_QUANTIZERS = False`) to run the quantizers eagerly, e.g. on platforms
+# without `torch.compile` support
+COMPILE_QUANTIZERS = os.environ.get("WHISPER_Q_COMPILE", "1").lower() not in ("0", "false", "no")
+
+# every combination of tensor rank, dtype and grad mode of the quantized weights and activations compiles its own
+# graph, which exceeds the default recompile limit of 8 per function
+_RECOMPILE_LIMIT = 64
+_RECOMPILE_LIMIT_NAME = "recompile_limit" if hasattr(torch._dynamo.config, "recompile_limit") else "cache_size_limit"
+
+
+def _maybe_compile(fn):
+    """
+    Compiles `fn` with dynamic shapes and calls the compiled function only while `COMPILE_QUANTIZERS` is set. The eager
+    function is available as `__wrapped__`.
+    """
+    compiled = torch._dynamo.config.patch(**{_RECOMPILE_LIMIT_NAME: _RECOMPILE_LIMIT})(torch.compile(fn, dynamic=True))
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if COMPILE_QUANTIZERS:
+            return compiled(*args, **kwargs)
+        return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def _clipped_ste(input: torch.Tensor, output: torch.Tensor, lo: float, hi: float) -> torch.Tensor:
+    """
+    Straight-through estimator of a quantizer clipping to [lo, hi]: returns `output`, with an identity gradient wrt
+    `input` for `lo < input < hi` and a zero gradient elsewhere, like the backward of the fused kernels. The mask is
+    explicit since the gradient of `clamp` at exactly `lo` / `hi` differs between PyTorch versions.
+    """
+    inside = (input > lo) & (input < hi)
+    return output + torch.where(inside, input - input.detach(), 0)
+
+
+@_maybe_compile
+def _sym_quantize(
+    input: torch.Tensor,
+    lo: float,
+    hi: float,
+    num_bits: int,
+    reduce_dim: Optional[Union[int, Tuple[int, ...]]],
+) -> torch.Tensor:
+    """Clip, scale and round `input` in one fused kernel. `reduce_dim=None` uses one scale for the whole tensor."""
+    x = input.detach().clamp(lo, hi)
+    # max(|x|) from a single min/max reduction, without materialising `x.abs()`
+    if reduce_dim is None:
+        min_input, max_input = torch.aminmax(x)
+    elif isinstance(reduce_dim, int):
+        min_input, max_input = torch.aminmax(x, dim=reduce_dim, keepdim=True)
+    else:
+        # `aminmax` only reduces over a single dim: flatten the trailing dims first
+        min_input, max_input = torch.aminmax(x.flatten(reduce_dim[0]), dim=-1, keepdim=True)
+        min_input, max_input = min_input.unsqueeze(-1), max_input.unsqueeze(-1)
+    max_input = torch.maximum(max_input, -min_input)
+    s = (2 ** (num_bits - 1) - 1) / max_input
+    output = (x * s).round() / s
+
+    if input.requires_grad:
+        # straight-through estimator: skip the rounding in the backward pass
+        output = _clipped_ste(input, output, lo, hi)
+    return output
+
+
+def _twn_codes(x: torch.Tensor, layerwise: bool) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Ternary codes {-1, 0, 1} of the (clipped) tensor `x` and their scale alpha, such that `x ~= codes * alpha`."""
+    # NOTE: every statistic below reduces `absx` or the bool mask `above` along the same axis, so Inductor computes
+    # the numerator and denominator of alpha in a single fused reduction
+    absx = x.abs()
+    if layerwise:
+        thres = 0.7 * absx.mean()
+        above = absx > thres
+        alpha = torch.where(above, absx, 0).sum() / above.sum().clamp_min(1)
+    else:  # row-wise only for embed / weight
+        thres = 0.7 * absx.mean(dim=1, keepdim=True)
+        above = absx > thres
+        alpha = torch.where(above, absx, 0).sum(dim=1, keepdim=True) / above.sum(dim=1, keepdim=True).clamp_min(1)
+
+    return torch.sign(x) * above.to(x.dtype), alpha
+
+
+@_maybe_compile
+def _twn_quantize(input: torch.Tensor, lo: float, hi: float, layerwise: bool) -> torch.Tensor:
+    """Ternarise `input` to {-alpha, 0, alpha} without materialising float masks."""
+    x = input.detach().clamp(lo, hi)
+
+    codes, alpha = _twn_codes(x, layerwise)
+    output = codes * alpha
+
+    if input.requires_grad:
+        output = _clipped_ste(input, output, lo, hi)
+    return output
+
+
+@_maybe_compile
+def _sym_quantize_int8(
+    input: torch.Tensor, lo: float, hi: float, num_bits: int
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Layerwise symmetric quantisation returning the int8 codes `q` and the scale `s`, such that `input ~= q / s`."""
+    input = input.clamp(lo, hi)
+    min_input, max_input = torch.aminmax(input)
+    s = (2 ** (num_bits - 1) - 1) / torch.maximum(max_input, -min_input)
+    return (input * s).round().to(torch.int8), s
 
 
-class TwnQuantizer(torch.autograd.Function):
+def _int8_matmul(a: torch.Tensor, b: torch.Tensor) -> torch.Tensor:
+    """int8 x int8 -> int32 matmul of `a` [M, K] and `b` [K, N]."""
+    m, k = a.shape
+    if a.is_cuda and k >= 16 and k % 8 == 0 and b.shape[1] % 8 == 0:
+        # cuBLASLt int8 GEMM requires M > 16: pad small (decoding) batches with zero rows
+        if m <= 16:
+            a = nn.functional.pad(a, (0, 0, 0, 32 - m))
+        return torch._int_mm(a, b)[:m]
+    if not a.is_cuda and _CPU_INT_MM_AVAILABLE:
+        # NOTE: VNNI (`vpdpbusd`) multiplies u8 x s8. oneDNN legalizes our symmetric s8 activations itself (+128 shift
+        # and a weight column-sum compensation), so shifting to u8 here would only add a pass over the activations
+        return torch._int_mm(a, b)
+    # fallback: float GEMM on the integer codes
+    return torch.mm(a.float(), b.float()).to(torch.int32)
+
+
+def _pack_ternary(codes: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Packs ternary codes [N, K] into sign and non-zero bitfields [N, ceil(K / 32)] of 32 weights per int32 word."""
+    n, k = codes.shape
+    codes = nn.functional.pad(codes, (0, -k % 32)).view(n, -1, 32)
+    shifts = torch.arange(32, dtype=torch.int64, device=codes.device)
+
+    def pack_bits(bits):
+        words = (bits.to(torch.int64) << shifts).sum(dim=-1)
+        # wrap to two's complement, torch has (almost) no uint32 support
+        return torch.where(words >= 2**31, words - 2**32, words).to(torch.int32)
+
+    return pack_bits(codes < 0), pack_bits(codes != 0)
+
+
+def _unpack_ternary(signs: torch.Tensor, nonzero: torch.Tensor, k: int) -> torch.Tensor:
+    """Inverse of `_pack_ternary`, returning the int8 ternary codes [N, K]."""
+    shifts = torch.arange(32, dtype=torch.int32, device=signs.device)
+    sign_bits = (signs.unsqueeze(-1) >> shifts) & 1
+    nonzero_bits = (nonzero.unsqueeze(-1) >> shifts) & 1
+    codes = nonzero_bits * (1 - 2 * sign_bits)
+    return codes.flatten(-2)[:, :k].to(torch.int8)
+
+
+def sym_quantize(input: torch.Tensor, lo: float, hi: float, num_bits: int, layerwise: bool) -> torch.Tensor:
+    """
+    Symmetric linear quantisation. Implemented with plain differentiable ops (rather than an `autograd.Function`) so
+    that `torch.compile` can fuse the backward pass with the surrounding layer.
+    """
+    # NOTE: dynamic scaling (max_input).
+    if layerwise:
+        reduce_dim = None
+    elif input.ndimension() <= 3:
+        # weight & hidden layer
+        reduce_dim = -1
+    elif input.ndimension() == 4:
+        # TODO: attention score matrix, calculate alpha / beta per head
+        reduce_dim = (-2, -1)
+    else:
+        raise ValueError(
+            f"Unsupported tensor size for quantization. Expected <4 dimensions, got {input.ndimension()}."
+        )
+
+    return _sym_quantize(input, lo, hi, num_bits, reduce_dim)
+
+
+def twn_quantize(input: torch.Tensor, lo: float, hi: float, num_bits: int, layerwise: bool) -> torch.Tensor:
     """Ternary Weight Networks (TWN). Ref: https://arxiv.org/abs/1605.04711"""
+    return _twn_quantize(input, lo, hi, layerwise)
 
-    @staticmethod
-    def forward(ctx: Any, input: torch.Tensor, clip_val: torch.Tensor, num_bits: int, layerwise: bool):
-        ctx.save_for_backward(input, clip_val)
-
-        input = torch.where(input < clip_val[1], input, clip_val[1])
-        input = torch.where(input > clip_val[0], input, clip_val[0])
-
-        if layerwise:
-            m = input.norm(p=1).div(input.nelement())
-            thres = 0.7 * m
-            pos = (input > thres).float()
-            neg = (input < -thres).float()
-            mask = (input.abs() > thres).float()
-            alpha = (mask * input).abs().sum() / mask.sum()
-            result = alpha * pos - alpha * neg
-        else:  # row-wise only for embed / weight
-            n = input[0].nelement()
-            m = input.data.norm(p=1, dim=1).div(n)
-            thres = (0.7 * m).view(-1, 1).expand_as(input)
-            pos = (input > thres).float()
-            neg = (input < -thres).float()
-            mask = (input.abs() > thres).float()
-            alpha = ((mask * input).abs().sum(dim=1) / mask.sum(dim=1)).view(-1, 1)
-            result = alpha * pos - alpha * neg
-
-        return result
-
-    @staticmethod
-    def backward(ctx, grad_output):
-        """
-        Args:
-            ctx: saved non-clipped full-precision tensor and clip_val
-            grad_output: gradient wrt the quantized tensor
-        Returns:
-            grad_input: estimated gradient wrt the full-precision tensor
-        """
-        input, clip_val = ctx.saved_tensors  # un-clipped input
-        grad_input = grad_output.clone()
-        grad_input[input.ge(clip_val[1])] = 0
-        grad_input[input.le(clip_val[0])] = 0
-        return grad_input, None, None, None
 
+class _QuantizedWeightCacheMixin:
+    """
+    Caches the quantized weight of a layer for inference. Weights are frozen outside of training, so the cache is only
+    dropped when the weight is replaced, loaded (`load_state_dict`), modified in-place or cast (`.to()`, `.half()`,
+    ...). The in-place version of the weight is only checked in eager mode: compiled graphs rely on the replacement,
+    loading and casting hooks, such that the cache lookup traces without graph breaks. In-place writes to
+    `self.weight.data` bypass the version counter of `self.weight`: call `train()` / `eval()` afterwards to drop the
+    cache.
+    """
+
+    def _init_weight_cache(self):
+        self.register_buffer("_wq_cache", None, persistent=False)
+        self._wq_key = None
+
+    def _clear_weight_cache(self):
+        self._wq_cache = None
+        self._wq_key = None
+
+    def _weight_key(self) -> Tuple[int, int]:
+        # identity and in-place version of the weight, both kept by device and dtype casts
+        return id(self.weight), self.weight._version
+
+    def _quantize_weight(self, layerwise: bool) -> torch.Tensor:
+        if self.training or torch.is_grad_enabled():
+            return self.weight_quantizer(self.weight, -self.clip_val, self.clip_val, self.weight_bits, layerwise)
+
+        if _is_compiling():
+            if self._wq_cache is None:
+                self._wq_cache = self.weight_quantizer(
+                    self.weight, -self.clip_val, self.clip_val, self.weight_bits, layerwise
+                )
+            return self._wq_cache
+
+        key = self._weight_key()
+        if self._wq_cache is None or self._wq_key != key:
+            weight = self.weight_quantizer(self.weight, -self.clip_val, self.clip_val, self.weight_bits, layerwise)
+            self._wq_cache = weight
+            self._wq_key = key
+        return self._wq_cache
+
+    def _weight_updated(self):
+        self._clear_weight_cache()
+
+    def __setattr__(self, name, value):
+        if name == "weight" and "_wq_cache" in self._buffers:
+            self._weight_updated()
+        super().__setattr__(name, value)
+
+    def _apply(self, *args, **kwargs):
+        self._clear_weight_cache()
+        return super()._apply(*args, **kwargs)
 
-class QuantizeLinear(nn.Linear):
+    def _load_from_state_dict(self, *args, **kwargs):
+        self._weight_updated()
+        super()._load_from_state_dict(*args, **kwargs)
+
+    def _set_weight_bits(self, weight_bits: int):
+        self.weight_bits = weight_bits
+        self.weight_quantizer = twn_quantize if weight_bits == 2 else sym_quantize
+        self._clear_weight_cache()
+
+    def train(self, mode: bool = True):
+        self._clear_weight_cache()
+        return super().train(mode)
+
+
+class _ActQuantizationMixin:
+    """
+    Activation quantization settings of a module. The bit-width is kept even when `quantize_act=False`, such that
+    `set_quant_phase` can switch activation quantization on later.
+    """
+
+    def _init_act_quant(self, quantize_act: bool, input_bits: int):
+        self.quantize_act = quantize_act
+        self.input_bits = input_bits
+        self.act_quantizer = sym_quantize
+
+    @property
+    def _act_noop(self) -> bool:
+        # activations are left in full precision when not quantized or for >= 16 bits (e.g. QAT warm-up)
+        return not self.quantize_act or self.input_bits >= 16
+
+
+class QuantizeLinear(_QuantizedWeightCacheMixin, _ActQuantizationMixin, nn.Linear):
     def __init__(
         self,
         in_features: int,
@@ -121,32 +308,168 @@ class QuantizeLinear(nn.Linear):
         clip_val: float = 2.5,
     ):
         super().__init__(in_features, out_features, bias=bias)
-        self.quantize_act = quantize_act
         self.weight_bits = weight_bits
-        self.quantize_act = quantize_act
         if self.weight_bits == 2:
-            self.weight_quantizer = TwnQuantizer
+            self.weight_quantizer = twn_quantize
         else:
-            self.weight_quantizer = SymQuantizer
-        self.register_buffer("weight_clip_val", torch.tensor([-clip_val, clip_val]))
-        if self.quantize_act:
-            self.input_bits = input_bits
-            self.act_quantizer = SymQuantizer
-            self.register_buffer("act_clip_val", torch.tensor([-clip_val, clip_val]))
+            self.weight_quantizer = sym_quantize
+        self.clip_val = clip_val
+        self._init_weight_cache()
+        self._init_act_quant(quantize_act, input_bits)
+        # integer weights for inference, see `pack_for_inference` and `pack_ternary_`
+        self.register_buffer("weight_int8", None, persistent=False)
+        self.register_buffer("weight_signs", None, persistent=False)
+        self.register_buffer("weight_nonzero", None, persistent=False)
+        self.register_buffer("weight_scale", None, persistent=False)
+        self._packed_key = None
+
+    @torch.no_grad()
+    def pack_for_inference(self):
+        """
+        Stores the quantized weight as int8 codes with a per-output-channel scale, such that inference runs an int8
+        matmul instead of a floating point GEMM on the dequantized weight. The packed weight is ignored in training
+        mode and moves with the layer on device and dtype casts. It is dropped (falling back to the floating point
+        path) if the weight is replaced, loaded or modified in-place after packing; call this again to re-pack it.
+
+        Packing requires activation quantization with `input_bits <= 8`, i.e. a model built from a [`WhisperQConfig`]
+        with `quantize_act=True` and `input_bits <= 8`. Use [`pack_model_for_inference`] to pack all the layers of a
+        model.
+        """
+        if not self.quantize_act or self.input_bits > 8 or self.weight_bits > 8:
+            raise ValueError(
+                "Packing for int8 inference requires activation quantization with `input_bits <= 8` and `weight_bits"
+                f" <= 8`, got `quantize_act={self.quantize_act}` and `weight_bits={self.weight_bits}`."
+            )
+        # take the integer codes and their scale straight from the quantizer rather than dequantizing and
+        # re-quantizing the weight
+        if self.weight_quantizer is twn_quantize:
+            weight = self.weight.clamp(-self.clip_val, self.clip_val)
+            weight_int8, weight_scale = _twn_codes(weight, layerwise=True)
+        else:
+            weight_int8, s = _sym_quantize_int8(self.weight, -self.clip_val, self.clip_val, self.weight_bits)
+            weight_scale = 1 / s
+        self.weight_int8 = weight_int8.to(torch.int8)
+        self.weight_signs, self.weight_nonzero = None, None
+        self.weight_scale = weight_scale.float().expand(self.out_features).contiguous()
+        self._packed_key = self._weight_key()
+
+    @torch.no_grad()
+    def pack_ternary_(self):
+        """
+        Same as `pack_for_inference`, but further bit-packs the ternary (TWN) weight codes into sign and non-zero masks
+        of 32 weights per int32 word, which the fused Triton kernel expands on the fly. At 2 bits per weight, the int8
+        matmul streams 16x less weight memory than the fp32 weight at decoding.
+
+        This only saves memory traffic, not storage: the fp32 weight is kept and the packed weight is not saved in the
+        state dict.
+        """
+        if self.weight_bits != 2:
+            raise ValueError(
+                f"Bit-packing requires ternary weights with `weight_bits=2`, got `weight_bits={self.weight_bits}`."
+            )
+        if not _TRITON_AVAILABLE:
+            raise ValueError(
+                "Bit-packing requires the fused Triton kernels (`triton` and PyTorch >= 2.4), use `pack_for_inference`"
+                " instead."
+            )
+        self.pack_for_inference()
+        self.weight_signs, self.weight_nonzero = _pack_ternary(self.weight_int8)
+        self.weight_int8 = None
+
+    def _set_weight_bits(self, weight_bits: int):
+        super()._set_weight_bits(weight_bits)
+        # packed weights are stale for the new bit-width
+        self._clear_packed_weight()
+
+    def _clear_packed_weight(self):
+        self.weight_int8, self.weight_signs, self.weight_nonzero, self.weight_scale = None, None, None, None
+        self._packed_key = None
+
+    def _drop_stale_packed_weight(self):
+        logger.warning(
+            "The weight of a packed `QuantizeLinear` was updated after `pack_for_inference`, dropping the stale packed"
+            " weight and falling back to the floating point path."
+        )
+        self._clear_packed_weight()
+
+    def _weight_updated(self):
+        super()._weight_updated()
+        if getattr(self, "weight_scale", None) is not None:
+            self._drop_stale_packed_weight()
+
+    def _apply(self, *args, **kwargs):
+        # device and dtype casts keep the identity and version of the weight in place, but re-key the packed weight
+        # in case the cast swapped in a new weight
+        packed = self.weight_scale is not None and self._packed_key == self._weight_key()
+        module = super()._apply(*args, **kwargs)
+        if packed:
+            self._packed_key = self._weight_key()
+        return module
 
     def forward(self, input):
+        if self.weight_scale is not None and not self.training:
+            # like the weight cache, in-place updates are only detected in eager mode
+            if _is_compiling() or self._packed_key == self._weight_key():
+                return self._int8_forward(input)
+            self._drop_stale_packed_weight()
+
         # quantize weight
-        weight = self.weight_quantizer.apply(self.weight, self.weight_clip_val, self.weight_bits, True)
+        weight = self._quantize_weight(layerwise=True)
         # quantize input
-        input = self.act_quantizer.apply(input, self.act_clip_val, self.input_bits, True)
-        out = nn.functional.linear(input, weight)
+        if not self._act_noop:
+            input = self.act_quantizer(input, -self.clip_val, self.clip_val, self.input_bits, True)
+        out = nn.functional.linear(input, weight, self.bias)
+
+        return out
+
+    def _int8_forward(self, input):
+        # int8 tensor-core `tl.dot` needs compute capability 8.0+
+        if _TRITON_AVAILABLE and input.is_cuda and torch.cuda.get_device_capability(input.device)[0] >= 8:
+            if self.weight_signs is not None:
+                return symquant_ternary_linear(
+                    input,
+                    self.weight_signs,
+                    self.weight_nonzero,
+                    self.weight_scale,
+                    self.bias,
+                    -self.clip_val,
+                    self.clip_val,
+                    self.input_bits,
+                )
+            return symquant_int8_linear(
+                input,
+                self.weight_int8,
+                self.weight_scale,
+                self.bias,
+                -self.clip_val,
+                self.clip_val,
+                self.input_bits,
+            )
+
+        if self.weight_int8 is None:
+            # no fused kernel to unpack the bit-packed ternary weight on the fly (e.g. on CPU): unpack it once and keep
+            # the int8 codes next to the packed weight
+            logger.warning(
+                "The fused ternary kernel is not available on this device, unpacking the bit-packed weight to int8."
+            )
+            self.weight_int8 = _unpack_ternary(self.weight_signs, self.weight_nonzero, self.in_features)
+        weight_int8 = self.weight_int8
+
+        input_int8, input_scale = _sym_quantize_int8(input, -self.clip_val, self.clip_val, self.input_bits)
+        out = _int8_matmul(input_int8.reshape(-1, self.in_features), weight_int8.t())
+        # dequantize the int32 accumulator with the activation and weight scales in one go, adding the bias in the
+        # same kernel
+        scale = self.weight_scale / input_scale
         if self.bias is not None:
-            out += self.bias.view(1, -1).expand_as(out)
+            out = torch.addcmul(self.bias.float(), out.float(), scale)
+        else:
+            out = out.float() * scale
+        out = out.to(input.dtype).view(*input.shape[:-1], self.out_features)
 
         return out
 
 
-class QuantizeEmbedding(nn.Embedding):
+class QuantizeEmbedding(_QuantizedWeightCacheMixin, nn.Embedding):
     def __init__(
         self, num_embeddings: int, embedding_dim: int, padding_idx=None, weight_bits: int = 2, clip_val: float = 2.5
     ):
@@ -155,21 +478,22 @@ class QuantizeEmbedding(nn.Embedding):
         self.layerwise = False
 
         if self.weight_bits == 2:
-            self.weight_quantizer = TwnQuantizer
+            self.weight_quantizer = twn_quantize
         else:
-            self.weight_quantizer = SymQuantizer
+            self.weight_quantizer = sym_quantize
 
-        self.register_buffer("weight_clip_val", torch.tensor([-clip_val, clip_val]))
+        self.clip_val = clip_val
+        self._init_weight_cache()
 
     def forward(self, input):
-        weight = self.weight_quantizer.apply(self.weight, self.weight_clip_val, self.weight_bits,self.layerwise)
+        weight = self._quantize_weight(layerwise=self.layerwise)
         out = nn.functional.embedding(
             input, weight, self.padding_idx, self.max_norm,
             self.norm_type, self.scale_grad_by_freq, self.sparse)
         return out
 
 
-class QuantizeConv(nn.Conv1d):
+class QuantizeConv(_QuantizedWeightCacheMixin, _ActQuantizationMixin, nn.Conv1d):
     def __init__(
         self,
         in_channels: int,
@@ -184,26 +508,66 @@ class QuantizeConv(nn.Conv1d):
         clip_val: float = 2.5,
     ):
         super().__init__(in_channels, out_channels, kernel_size, stride, padding, bias=bias)
-        self.quantize_act = quantize_act
         self.weight_bits = weight_bits
-        self.quantize_act = quantize_act
         if self.weight_bits == 2:
-            self.weight_quantizer = TwnQuantizer
+            self.weight_quantizer = twn_quantize
         else:
-            self.weight_quantizer = SymQuantizer
-        self.register_buffer("weight_clip_val", torch.tensor([-clip_val, clip_val]))
-        if self.quantize_act:
-            self.input_bits = input_bits
-            self.act_quantizer = SymQuantizer
-            self.register_buffer("act_clip_val", torch.tensor([-clip_val, clip_val]))
+            self.weight_quantizer = sym_quantize
+        self.clip_val = clip_val
+        self._init_weight_cache()
+        self._init_act_quant(quantize_act, input_bits)
 
     def forward(self, input):
         # quantize weight
-        weight = self.weight_quantizer.apply(self.weight, self.weight_clip_val, self.weight_bits, True)
+        weight = self._quantize_weight(layerwise=True)
         # quantize input
-        input = self.act_quantizer.apply(input, self.act_clip_val, self.input_bits, True)
-        out = nn.functional.conv1d(input, weight, stride=self.stride, padding=self.padding)
-        if self.bias is not None:
-            out += self.bias.view(1, -1, 1).expand_as(out)
+        if not self._act_noop:
+            input = self.act_quantizer(input, -self.clip_val, self.clip_val, self.input_bits, True)
+        out = nn.functional.conv1d(input, weight, self.bias, stride=self.stride, padding=self.padding)
 
         return out
+
+
+# (input_bits, weight_bits) of each quantization-aware training phase, see `set_quant_phase`
+QUANT_PHASES = {"warmup": (16, 16), "int8": (8, 8), "int2": (8, 2)}
+
+
+def set_quant_phase(model: nn.Module, phase: str):
+    """
+    Sets the bit-widths of all quantized modules in `model` for a quantization-aware training phase: `"warmup"` trains
+    with full-precision activations (activation quantization is skipped altogether) and 16-bit weights, `"int8"` with
+    8-bit activations and weights and `"int2"` with 8-bit activations and ternary weights. The `"int8"` and `"int2"`
+    phases switch activation quantization on for modules built with `quantize_act=False`. The bit-widths are also
+    written to `model.config` (if any), so that a checkpoint saved during a phase reloads in the same phase.
+    """
+    if phase not in QUANT_PHASES:
+        raise ValueError(f"Unknown quantization phase {phase}, expected one of {list(QUANT_PHASES)}.")
+    input_bits, weight_bits = QUANT_PHASES[phase]
+
+    for module in model.modules():
+        if isinstance(module, _QuantizedWeightCacheMixin):
+            module._set_weight_bits(weight_bits)
+        if isinstance(module, _ActQuantizationMixin):
+            module.quantize_act = module.quantize_act or input_bits < 16
+            module.input_bits = input_bits
+
+    config = getattr(model, "config", None)
+    if config is not None:
+        config.quantize_act = getattr(config, "quantize_act", False) or input_bits < 16
+        config.input_bits = input_bits
+        config.weight_bits = weight_bits
+
+
+def pack_model_for_inference(model: nn.Module, bit_pack: bool = False):
+    """
+    Packs the weights of all [`QuantizeLinear`] layers in `model` for int8 inference, see
+    [`QuantizeLinear.pack_for_inference`]. With `bit_pack=True`, ternary weights are further bit-packed for the fused
+    Triton kernel, see [`QuantizeLinear.pack_ternary_`]. The model has to be built with `quantize_act=True` and
+    `input_bits <= 8`.
+    """
+    for module in model.modules():
+        if isinstance(module, QuantizeLinear):
+            if bit_pack and module.weight_bits == 2:
+                module.pack_ternary_()
+            else:
+                module.pack_for_inference()